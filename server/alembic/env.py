@@ -68,6 +68,18 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # Reuse a connection handed in by the caller (see db.models.migrator)
+    # so migrations run on the application's pool instead of a new one.
+    connection = config.attributes.get("connection", None)
+    if connection is not None:
+        context.configure(
+            connection=connection, target_metadata=target_metadata
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
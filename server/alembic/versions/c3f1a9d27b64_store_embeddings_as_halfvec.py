@@ -0,0 +1,44 @@
+"""store embeddings as halfvec
+
+Revision ID: c3f1a9d27b64
+Revises: 5a5ca85f8e05
+Create Date: 2026-10-15 10:12:41.538207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f1a9d27b64'
+down_revision: Union[str, Sequence[str], None] = '5a5ca85f8e05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_langchain_pg_embedding_embedding_hnsw")
+    op.execute(
+        "ALTER TABLE langchain_pg_embedding "
+        "ALTER COLUMN embedding TYPE halfvec(768) USING embedding::halfvec(768)"
+    )
+    op.create_index(
+        'ix_langchain_pg_embedding_embedding_hnsw',
+        'langchain_pg_embedding',
+        ['embedding'],
+        unique=False,
+        postgresql_using='hnsw',
+        postgresql_ops={'embedding': 'halfvec_cosine_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_langchain_pg_embedding_embedding_hnsw', table_name='langchain_pg_embedding')
+    op.execute(
+        "ALTER TABLE langchain_pg_embedding "
+        "ALTER COLUMN embedding TYPE vector USING embedding::vector"
+    )
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import os
+import threading
 from dotenv import load_dotenv
+from sqlalchemy import create_engine
 
 load_dotenv()
 
@@ -10,4 +12,29 @@ class Config:
 
     POSTGRES_CONNECTION = os.getenv("POSTGRES_CONNECTION")
     POSTGRES_MIGRATION = os.getenv("POSTGRES_MIGRATION")
-    GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
\ No newline at end of file
+    GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Return the process-wide SQLAlchemy engine, creating it on first use.
+    All database access goes through this engine so pool settings stay in one place.
+    """
+    global _engine
+    if _engine is None:
+        # worker threads can ask for the engine concurrently; build only one pool
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    Config.POSTGRES_CONNECTION,
+                    pool_size=10,
+                    max_overflow=20,
+                    pool_pre_ping=True,
+                    pool_recycle=1800,
+                    pool_timeout=30,
+                )
+    return _engine
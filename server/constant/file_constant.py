@@ -1,4 +1,5 @@
-ALLOWED_EXTENSIONS = {"pdf", "doc", "docx", "txt"}
+ALLOWED_EXTENSIONS = frozenset({"pdf", "doc", "docx", "txt"})
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+MULTIPART_OVERHEAD = 64 * 1024  # slack for multipart boundaries and part headers in Content-Length
 UPLOAD_DIR = "media"
 CHUNK_SIZE = 1024 * 1024  # 1 MB
\ No newline at end of file
@@ -1,32 +1,31 @@
 # Create Db
 
-from config.config import Config 
-from sqlalchemy import create_engine, inspect, text
+from sqlalchemy import inspect, text
 from models import Base, DocumentChunk
+from config.config import get_engine
 
-engine = create_engine(Config.POSTGRES_CONNECTION)
+engine = get_engine()
 
-def create_extension():
+def create_extension(conn):
     """
     Create the vector extension if it does not exist.
     """
-    with engine.connect() as conn:
-        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
-        conn.commit()
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
 
 def create_tables():
     """
     Check if the document_chunks table exists.
     If it does, print an error message; if not, create the table.
+    Everything runs in one transaction on a single connection.
     """
-    create_extension()
-    
-    inspector = inspect(engine)
-    if inspector.has_table(DocumentChunk.__tablename__):
-        print(f"Error: Table '{DocumentChunk.__tablename__}' already exists!")
-    else:
-        Base.metadata.create_all(engine)
-        print(f"Table '{DocumentChunk.__tablename__}' created successfully!")
+    with engine.begin() as conn:
+        create_extension(conn)
+
+        if inspect(conn).has_table(DocumentChunk.__tablename__):
+            print(f"Error: Table '{DocumentChunk.__tablename__}' already exists!")
+        else:
+            Base.metadata.create_all(bind=conn)
+            print(f"Table '{DocumentChunk.__tablename__}' created successfully!")
 
 if __name__ == "__main__":
     create_tables()
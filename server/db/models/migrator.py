@@ -1,30 +1,46 @@
 import os
-import glob
+import sys
+import time
+import functools
+import threading
 from alembic.config import Config
 from alembic import command
 from alembic.script import ScriptDirectory
-from sqlalchemy import create_engine, text
-from config.config import Config as AppConfig
+from sqlalchemy import text
+from config.config import get_engine
+from db.models.models import Base
 
+# Default for helpers taking a db_state; distinct from None, which means the probe failed
+_NOT_PROBED = object()
+
+# Interval between "still running" warnings while an upgrade is in progress
+UPGRADE_WATCHDOG_SECONDS = 60
+
+def run_alembic_command(alembic_cfg, fn, *args, **kwargs):
+    """
+    Run an Alembic command on a connection borrowed from the shared engine.
+    env.py picks the connection up from alembic_cfg.attributes instead of opening its own.
+    """
+    with get_engine().begin() as connection:
+        alembic_cfg.attributes["connection"] = connection
+        try:
+            return fn(alembic_cfg, *args, **kwargs)
+        finally:
+            alembic_cfg.attributes.pop("connection", None)
+
+@functools.lru_cache(maxsize=1)
 def get_latest_migration_file():
-    """Get the latest migration file from the versions directory."""
+    """
+    Get the latest revision id from the migration scripts.
+    Uses the revision graph rather than file timestamps, which depend on checkout order.
+    The result is cached since the versions directory does not change while the process runs.
+    """
     project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    versions_dir = os.path.join(project_root, "alembic", "versions")
-    
-    # Get all Python files in versions directory
-    migration_files = glob.glob(os.path.join(versions_dir, "*.py"))
-    
-    if not migration_files:
-        return None
-    
-    # Sort by creation time and get the latest
-    latest_file = max(migration_files, key=os.path.getctime)
-    
-    # Extract revision ID from filename (assumes format: revision_description.py)
-    filename = os.path.basename(latest_file)
-    revision_id = filename.split('_')[0]
+    alembic_ini_path = os.path.join(project_root, "alembic.ini")
+    script = ScriptDirectory.from_config(Config(alembic_ini_path))
     
-    return revision_id
+    # Raises if there are multiple heads; callers already handle errors
+    return script.get_current_head()
 
 def get_all_heads(alembic_cfg):
     """Get all head revisions in the migration tree."""
@@ -56,55 +72,90 @@ def merge_heads_if_needed(alembic_cfg):
     
     return False
 
-def check_if_fresh_database():
+def upgrade_to_heads(alembic_cfg):
     """
-    Check if this is a fresh database by counting user tables.
-    A fresh database should have very few or no user tables.
+    Upgrade every head in a single Alembic run, logging the duration and
+    warning periodically if the upgrade appears stuck.
+    Targets "heads" when more than one head remains (e.g. the merge failed),
+    since upgrading to "head" would error out in that case.
+    """
+    target = "heads" if len(get_all_heads(alembic_cfg)) > 1 else "head"
+    started = time.monotonic()
+    done = threading.Event()
+
+    def watchdog():
+        while not done.wait(UPGRADE_WATCHDOG_SECONDS):
+            print(f"Upgrade to {target} still running after {time.monotonic() - started:.0f}s")
+
+    threading.Thread(target=watchdog, daemon=True).start()
+    try:
+        run_alembic_command(alembic_cfg, command.upgrade, target)
+    finally:
+        done.set()
+        print(f"Upgrade to {target} took {time.monotonic() - started:.2f}s")
+
+def probe_database_state():
+    """
+    Inspect the database in a single round trip.
+    Returns a (user_table_count, has_alembic_version) tuple, or None if the probe fails.
+    Uses pg_catalog directly since information_schema views are considerably slower.
     """
     try:
-        engine = create_engine(AppConfig.POSTGRES_CONNECTION)
-        with engine.connect() as conn:
-            # Count all user tables (excluding system tables)
+        with get_engine().connect() as conn:
             result = conn.execute(text("""
-                SELECT COUNT(*) 
-                FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_type = 'BASE TABLE'
-                AND table_name NOT LIKE 'pg_%'
-                AND table_name NOT LIKE 'sql_%'
+                SELECT
+                    (SELECT COUNT(*)
+                     FROM pg_catalog.pg_class c
+                     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                     WHERE n.nspname = 'public'
+                     AND c.relkind IN ('r', 'p')
+                     AND c.relname NOT LIKE 'pg_%'
+                     AND c.relname NOT LIKE 'sql_%'),
+                    (SELECT to_regclass('public.alembic_version') IS NOT NULL)
             """))
-            
-            table_count = result.scalar()
-            is_fresh = table_count <= 1
-            
-            print(f"Found {table_count} user tables in database. Fresh: {is_fresh}")
-            return is_fresh
-            
+            table_count, has_alembic_version = result.fetchone()
+            return table_count, has_alembic_version
     except Exception as e:
         print(f"Error checking database state: {e}")
+        return None
+
+def check_if_fresh_database(db_state=_NOT_PROBED):
+    """
+    Check if this is a fresh database by counting user tables.
+    A fresh database should have very few or no user tables.
+    Accepts the result of probe_database_state() (including a failed None) to avoid querying again.
+    """
+    if db_state is _NOT_PROBED:
+        db_state = probe_database_state()
+    if db_state is None:
         return True # Assume fresh if we can't check
 
-def reset_alembic_version_to_latest():
-    """Reset alembic_version table to point to the latest migration file."""
+    table_count = db_state[0]
+    is_fresh = table_count <= 1
+
+    print(f"Found {table_count} user tables in database. Fresh: {is_fresh}")
+    return is_fresh
+
+def reset_alembic_version_to_latest(db_state=_NOT_PROBED):
+    """
+    Reset alembic_version table to point to the latest migration file.
+    Accepts the result of probe_database_state() (including a failed None) to avoid querying again.
+    """
     try:
-        engine = create_engine(AppConfig.POSTGRES_CONNECTION)
         latest_revision = get_latest_migration_file()
         
         if not latest_revision:
             print("No migration files found.")
             return
         
-        with engine.connect() as conn:
-            # Check if alembic_version table exists
-            result = conn.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'alembic_version'
-                );
-            """))
-            
-            table_exists = result.scalar()
-            
+        if db_state is _NOT_PROBED:
+            db_state = probe_database_state()
+        if db_state is None:
+            print("Skipping alembic version reset: database state unknown.")
+            return
+        table_exists = db_state[1]
+        
+        with get_engine().connect() as conn:
             if table_exists:
                 # Update existing version
                 conn.execute(text("""
@@ -133,56 +184,42 @@ def migrate_all():
     """
     Runs Alembic migrations to upgrade the database schema to the latest version.
     Automatically handles both fresh databases, existing databases, and multiple heads.
+    Raises on failure without touching alembic_version, so a failed run is never
+    recorded as being at head (the entrypoint relies on this to stop startup).
     """
     
     project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     alembic_ini_path = os.path.join(project_root, "alembic.ini")
     alembic_cfg = Config(alembic_ini_path)
     
-    # Check if this is a fresh database
-    is_fresh = check_if_fresh_database()
+    # Probe the database once and share the result with the helpers below
+    db_state = probe_database_state()
+    if db_state is None:
+        raise RuntimeError("Could not inspect the database; refusing to migrate.")
+    is_fresh = check_if_fresh_database(db_state)
+    
+    # Check for multiple heads and merge if needed
+    merge_heads_if_needed(alembic_cfg)
     
     if is_fresh:
-        print("Fresh database detected. Running all migrations from scratch...")
+        print("Fresh database detected. Creating schema from models...")
         
-        try:
-            # Check for multiple heads and merge if needed
-            merge_heads_if_needed(alembic_cfg)
-            
-            # For fresh database, run all migrations from the beginning
-            command.upgrade(alembic_cfg, "head")
-            
-        except Exception as e:
-            print(f"Migration error: {e}")
-            # If migration fails, ensure we have the right version set
-            reset_alembic_version_to_latest()
+        # For fresh database, build the schema from the models in one pass
+        # and stamp it as head instead of replaying every revision
+        Base.metadata.create_all(get_engine())
+        run_alembic_command(alembic_cfg, command.stamp, "head")
     
     else:
         print("Existing database detected. Handling multiple heads and updating...")
         
-        try:
-            # Check for multiple heads and merge if needed
-            heads_merged = merge_heads_if_needed(alembic_cfg)
-            
-            if heads_merged:
-                # If heads were merged, upgrade to the new merged head
-                command.upgrade(alembic_cfg, "head")
-            else:
-                # Normal case: update version pointer and run migrations
-                reset_alembic_version_to_latest()
-                command.upgrade(alembic_cfg, "head")
-
-            
-        except Exception as e:
-            print(f"Migration error: {e}")
-            # Fallback: try to stamp the latest version
-            try:
-                latest_revision = get_latest_migration_file()
-                if latest_revision:
-                    command.stamp(alembic_cfg, latest_revision)
-                    print(f"Stamped database to version: {latest_revision}")
-            except Exception as stamp_error:
-                print(f"Stamp error: {stamp_error}")
+        if not db_state[1]:
+            # Tables exist but were never versioned (e.g. created by langchain_postgres):
+            # they match the base revision, so stamp that and let the upgrade apply the rest.
+            # When alembic_version exists, leave it alone so pending revisions actually run.
+            bases = ScriptDirectory.from_config(alembic_cfg).get_bases()
+            run_alembic_command(alembic_cfg, command.stamp, bases)
+            print(f"Stamped unversioned database to base revision: {', '.join(bases)}")
+        upgrade_to_heads(alembic_cfg)
 
 def fix_multiple_heads():
     """
@@ -200,4 +237,34 @@ def fix_multiple_heads():
         merge_heads_if_needed(alembic_cfg)
         print("Multiple heads resolved.")
     else:
-        print("No multiple heads detected.")
\ No newline at end of file
+        print("No multiple heads detected.")
+
+def is_database_at_head():
+    """
+    Check whether the database's alembic_version matches the migration heads.
+    Used at app startup, since migrations now run before the app (see entrypoint.sh).
+    """
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    alembic_ini_path = os.path.join(project_root, "alembic.ini")
+    alembic_cfg = Config(alembic_ini_path)
+
+    heads = set(get_all_heads(alembic_cfg))
+    db_state = probe_database_state()
+    if not heads or db_state is None or not db_state[1]:
+        return False
+
+    with get_engine().connect() as conn:
+        result = conn.execute(text("SELECT version_num FROM alembic_version"))
+        current = {row[0] for row in result}
+
+    print(f"Database revision: {sorted(current)}. Expected heads: {sorted(heads)}")
+    return current == heads
+
+if __name__ == "__main__":
+    # Exit non-zero on failure so entrypoint.sh stops before starting the app
+    try:
+        migrate_all()
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        sys.exit(1)
+    print("Database migration completed successfully.")
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, Text, String, JSON, ForeignKey, Float, Enum
-from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, Integer, Text, String, JSON, ForeignKey, Float, Enum, Index
+from pgvector.sqlalchemy import HALFVEC
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 import uuid
 
@@ -19,7 +19,17 @@ class LangchainPgEmbedding(Base):
     collection_id = Column(UUID(as_uuid=True), 
                            ForeignKey("langchain_pg_collection.uuid"), 
                            nullable=False)
-    embedding = Column(Vector(), nullable=False)
+    # float16 vectors sized for models/embedding-001
+    embedding = Column(HALFVEC(768), nullable=False)
     document = Column(String, nullable=False)
     cmetadata = Column(JSONB, nullable=True)
 
+    __table_args__ = (
+        Index(
+            "ix_langchain_pg_embedding_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "halfvec_cosine_ops"},
+        ),
+    )
+
@@ -0,0 +1,12 @@
+#!/bin/sh
+# Run database migrations, then start the API.
+# Migrations are kept out of the app's startup so it becomes ready immediately.
+# Uploaded files are processed by a separate arq worker, started from this
+# directory with: arq services.worker.WorkerSettings
+set -e
+
+cd "$(dirname "$0")"
+
+python -m db.models.migrator
+
+exec uvicorn main:app --host "${HOST:-0.0.0.0}" --port "${PORT:-8000}"
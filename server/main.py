@@ -2,27 +2,58 @@ from fastapi import FastAPI,Request, APIRouter
 from rest_api import router_api
 import asyncio
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from constant.file_constant import MAX_FILE_SIZE, MULTIPART_OVERHEAD
 from contextlib import asynccontextmanager
 
-from db.models.migrator import migrate_all
+from db.models.migrator import is_database_at_head
+from services.task_queue import close_redis_pool
 
 # app = FastAPI()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
-        await asyncio.to_thread(migrate_all)
-        print("Database migration completed successfully.", flush=True)
+        # Migrations run out of band (entrypoint.sh); only verify the schema here
+        if not await asyncio.to_thread(is_database_at_head):
+            raise RuntimeError(
+                "Database schema is not at the latest migration. "
+                "Run 'python -m db.models.migrator' before starting the app."
+            )
+        print("Database schema is up to date.", flush=True)
         print("Starting Application...", flush=True)
         yield
     except Exception as e:
         print(f"Error during startup: {e}", flush=True)
         raise
     finally:
+        await close_redis_pool()
         print("Shutting down application...", flush=True)
 
 app = FastAPI(title="Research Paper Chat-bot", version="1.0", lifespan=lifespan)
 
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """
+    Reject uploads whose Content-Length already exceeds MAX_FILE_SIZE before the body is read.
+    This has to run as middleware because FastAPI parses the multipart body before the endpoint runs.
+    Chunked uploads without the header are still caught by the size check in upload_file.
+    Content-Length covers the whole multipart body, so MULTIPART_OVERHEAD is allowed on top of the limit.
+    Registered before CORSMiddleware so CORS stays outermost and the 413 carries CORS headers.
+    """
+    content_length = request.headers.get("content-length")
+    if (
+        request.url.path.endswith("/upload/")
+        and content_length
+        and content_length.isdigit()
+        and int(content_length) > MAX_FILE_SIZE + MULTIPART_OVERHEAD
+    ):
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"File too large. Max allowed size is {MAX_FILE_SIZE // (1024 * 1024)} MB"},
+        )
+    return await call_next(request)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Adjust this to your needs
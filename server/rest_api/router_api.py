@@ -1,10 +1,12 @@
 import os
-import asyncio
+import uuid
+import hashlib
+import aiofiles
 from fastapi import UploadFile, APIRouter, File, HTTPException
 from pydantic import ValidationError
 from constant.file_constant import CHUNK_SIZE, MAX_FILE_SIZE, UPLOAD_DIR, ALLOWED_EXTENSIONS
 from validation.pydentic_model import FileMeta
-from services.upload_processor import process_file
+from services.task_queue import enqueue_process_file, is_already_processed
 
 router = APIRouter()
 
@@ -23,40 +25,71 @@ async def upload_file(file: UploadFile = File(...)):
             error_msg = e.errors()[0].get("msg", "Invalid file")
             raise HTTPException(status_code=400, detail=error_msg)
 
+        # Content-Length is checked by middleware in main.py; this catches what it cannot see
+        if file.size is not None and file.size > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Max allowed size is {MAX_FILE_SIZE // (1024 * 1024)} MB"
+            )
+
         # Ensure upload directory exists
         os.makedirs(UPLOAD_DIR, exist_ok=True)
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
+        # stream to a unique temp name; the final name depends on the content hash
+        file_path = os.path.join(UPLOAD_DIR, f".{uuid.uuid4().hex}.part")
 
         size = 0
+        # hash while streaming so duplicates can be detected without re-reading the file
+        hasher = hashlib.sha256()
         try:
-            with open(file_path, "wb") as f:
+            async with aiofiles.open(file_path, "wb") as f:
                 while chunk := await file.read(CHUNK_SIZE):
                     size += len(chunk)
                     if size > MAX_FILE_SIZE:
                         raise HTTPException(
-                            status_code=400,
+                            status_code=413,
                             detail=f"File too large. Max allowed size is {MAX_FILE_SIZE // (1024 * 1024)} MB"
                         )
-                    f.write(chunk)
+                    hasher.update(chunk)
+                    await f.write(chunk)
         except HTTPException:
             # Cleanup partially written file
             if os.path.exists(file_path):
                 os.remove(file_path)
             raise
         
-        # Start background processing for allowed text/document types
+        content_hash = hasher.hexdigest()
+
+        # Store under the content hash so the path handed to the worker always holds
+        # exactly the bytes that were hashed; same-named uploads can no longer overwrite it
+        final_path = os.path.join(UPLOAD_DIR, content_hash + os.path.splitext(file.filename)[1].lower())
+        os.replace(file_path, final_path)
+        file_path = final_path
+
+        # Queue background processing for allowed text/document types,
+        # skipping content that has already been embedded
+        processing = "skipped"
         try:
             ext = os.path.splitext(file.filename)[1].lower().lstrip('.')
             if ext in ALLOWED_EXTENSIONS:
-                asyncio.create_task(asyncio.to_thread(process_file, file_path))
+                if await is_already_processed(content_hash):
+                    print(f"Skipping processing for {file_path}: identical content already processed")
+                    processing = "already_processed"
+                elif await enqueue_process_file(file_path, content_hash) is None:
+                    print(f"Skipping processing for {file_path}: identical content already queued")
+                    processing = "already_queued"
+                else:
+                    processing = "queued"
         except Exception as e:
             # log but do not fail the upload
-            print(f"Failed to start background processing for {file_path}: {e}")
+            print(f"Failed to queue background processing for {file_path}: {e}")
+            processing = "failed_to_queue"
 
         return {
             "filename": file.filename,
             "size": f"{size / (1024 * 1024):.2f} MB",
             "path": file_path,
+            "sha256": content_hash,
+            "processing": processing,
             "status": "Uploaded successfully",
         }
     except HTTPException:
@@ -0,0 +1,60 @@
+import asyncio
+from arq import create_pool
+from arq.connections import RedisSettings
+from config.config import Config
+
+# Enqueue side of the background jobs. Kept free of the processing imports
+# (genai, pypdfium2, langchain_postgres) so the API process stays light;
+# the jobs themselves live in services.worker.
+
+REDIS_SETTINGS = RedisSettings.from_dsn(Config.REDIS_URL)
+
+# Redis key prefix marking a content hash whose embeddings are already stored
+PROCESSED_KEY_PREFIX = "echolet:processed:"
+
+_redis_pool = None
+_redis_pool_lock = asyncio.Lock()
+
+
+async def get_redis_pool():
+    """
+    Return the shared arq Redis pool used to enqueue jobs, creating it on first use.
+    """
+    global _redis_pool
+    if _redis_pool is None:
+        # concurrent first uploads would otherwise each create (and leak) a pool
+        async with _redis_pool_lock:
+            if _redis_pool is None:
+                _redis_pool = await create_pool(REDIS_SETTINGS)
+    return _redis_pool
+
+
+async def close_redis_pool():
+    """
+    Close the shared arq Redis pool if it was opened.
+    """
+    global _redis_pool
+    if _redis_pool is not None:
+        await _redis_pool.close()
+        _redis_pool = None
+
+
+async def is_already_processed(content_hash: str) -> bool:
+    """
+    Check whether a file with this SHA-256 has already been processed successfully.
+    """
+    redis = await get_redis_pool()
+    return bool(await redis.exists(PROCESSED_KEY_PREFIX + content_hash))
+
+
+async def enqueue_process_file(file_path: str, content_hash: str = None):
+    """
+    Queue an uploaded file for text extraction, embedding and storage by the worker.
+    When a content hash is given it doubles as the job id, so identical uploads arriving
+    together are only queued once. Returns None if a job with that id is already queued
+    or running. The worker keeps no results (keep_result=0), so once a job has finished
+    or failed, the same content can be queued again.
+    """
+    redis = await get_redis_pool()
+    job_id = f"process_file:{content_hash}" if content_hash else None
+    return await redis.enqueue_job("process_file", file_path, content_hash, _job_id=job_id)
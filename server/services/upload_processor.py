@@ -1,13 +1,38 @@
 import os
+import json
+import time
+import codecs
 import uuid
-import docx
-import textract
+import threading
+import functools
+import subprocess
+import numpy as np
 import google.generativeai as genai
-from config.config import Config
+from google.api_core.exceptions import DeadlineExceeded, InternalServerError, ResourceExhausted, ServiceUnavailable
+from config.config import Config, get_engine
 from langchain_postgres.vectorstores import PGVector
-from langchain.docstore.document import Document
+from sqlalchemy import text
 from typing import List, Optional
-from PyPDF2 import PdfReader
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+import charset_normalizer
+from charset_normalizer.utils import is_multi_byte_encoding
+from concurrent.futures import ThreadPoolExecutor
+
+# Gemini's batch endpoint accepts at most 100 texts per request
+EMBED_BATCH_SIZE = 100
+EMBED_MAX_WORKERS = 4
+
+# Rate limiting and transient server errors are retried with exponential backoff;
+# anything else (bad key, unknown model, invalid input) fails immediately
+TRANSIENT_EMBED_ERRORS = (ResourceExhausted, ServiceUnavailable, DeadlineExceeded, InternalServerError)
+EMBED_MAX_RETRIES = 5
+EMBED_BACKOFF_SECONDS = 1.0
+
+# Bytes read from the start of a .txt upload to detect its encoding
+TXT_SNIFF_BYTES = 64 * 1024
 
 # Embedding generator using Google Generative AI
 class FileEmbeddingGenerator:
@@ -17,22 +42,47 @@ class FileEmbeddingGenerator:
         self.embedding_model = genai.GenerativeModel(self.embedding_model_name)
 
 
-    def generate_embeddings(self, texts: list[str]) -> list[list[float]]:
-        try:
-            embeddings = []
-            for text in texts:
+    def _embed(self, content):
+        """
+        Embed a single text or a list of texts, backing off and retrying on transient errors.
+        """
+        for attempt in range(EMBED_MAX_RETRIES):
+            try:
                 response = genai.embed_content(
                     model=self.embedding_model_name,
-                    content=text,
-                    task_type="retrieval_document",
-                    title=text[:50]
+                    content=content,
+                    task_type="retrieval_document"
                 )
-                embeddings.append(response['embedding'])
-            return embeddings
+                return response['embedding']
+            except TRANSIENT_EMBED_ERRORS as e:
+                if attempt == EMBED_MAX_RETRIES - 1:
+                    raise
+                delay = EMBED_BACKOFF_SECONDS * 2 ** attempt
+                print(f"[upload_processor] Transient embedding error, retrying in {delay:.0f}s: {e}")
+                time.sleep(delay)
+
+    def generate_embeddings(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed texts in batches of EMBED_BATCH_SIZE, one request per batch.
+        If a batch keeps hitting rate limits or transient errors after backing off, it is
+        retried as a few concurrent single-text requests; other errors are raised immediately.
+        Returns float16 vectors to match the halfvec embedding column.
+        """
+        try:
+            embeddings = []
+            for start in range(0, len(texts), EMBED_BATCH_SIZE):
+                batch = texts[start:start + EMBED_BATCH_SIZE]
+                try:
+                    embeddings.extend(self._embed(batch))
+                except TRANSIENT_EMBED_ERRORS as e:
+                    print(f"[upload_processor] Batch embedding still failing, retrying per text: {e}")
+                    with ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS) as executor:
+                        embeddings.extend(executor.map(self._embed, batch))
+            return np.asarray(embeddings, dtype=np.float16)
         except Exception as e:
             raise Exception(f"Error generating embeddings for texts: {e}")
         
-    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
         return self.generate_embeddings(texts)
 
 
@@ -41,26 +91,42 @@ class FileEmbeddingGenerator:
 class PGVectorStore:
     def __init__(self):
         """
-        Initializes the PGVectorStore class, connecting to PostgreSQL using the connection string in the Config class.
+        Initializes the PGVectorStore class, connecting to PostgreSQL through the shared engine from config.get_engine().
         Uses the provided collection_name to store the embeddings.
         """
         try:
-            connection = Config.POSTGRES_CONNECTION
-            collection_name = "file_embeddings"
-            embedding_generator = FileEmbeddingGenerator()
+            # share the tuned application pool rather than letting PGVector build its own
+            connection = get_engine()
+            self.collection_name = "file_embeddings"
+            embedding_generator = get_embedding_generator()
             self.vector_store = PGVector(
                 embeddings=embedding_generator,
                 connection=connection,
-                collection_name=collection_name,
+                collection_name=self.collection_name,
                 use_jsonb=True
             )
         except Exception as e:
             raise Exception(f"Error connecting to PostgreSQL: {e}")
 
 
+    def _copy_rows(self, rows: list):
+        """
+        Bulk-load embedding rows with a single COPY instead of one INSERT per document.
+        """
+        with get_engine().begin() as conn:
+            collection_id = conn.execute(
+                text("SELECT uuid FROM langchain_pg_collection WHERE name = :name"),
+                {"name": self.collection_name}
+            ).scalar_one()
+            with conn.connection.driver_connection.cursor() as cursor, cursor.copy(
+                "COPY langchain_pg_embedding (id, collection_id, embedding, document, cmetadata) FROM STDIN"
+            ) as copy:
+                for doc_id, embedding, document, metadata in rows:
+                    copy.write_row((doc_id, collection_id, embedding, document, metadata))
+
     def store_embeddings(self, chunks: list, embeddings: list):
         try:
-            documents = []
+            rows = []
             expected_dimension = None
 
             for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
@@ -71,43 +137,83 @@ class PGVectorStore:
                     raise ValueError(
                         f"Warning: Skipping chunk {i} due to inconsistent embedding dimension. Expected {expected_dimension}, got {len(embedding)}."
                     )
-                embedding = [float(x) for x in embedding]
-                doc_metadata = {
-                    "content": chunk,
-                    "embedding": embedding,
-                    "chunk_sequence": i
-                }
-                doc = Document(page_content=chunk, metadata=doc_metadata)
-                doc.id = str(uuid.uuid4())
-                documents.append(doc)
-
-            print(f"Number of documents to attempt adding: {len(documents)}")
-
-            if documents:
-                added_ids = self.vector_store.add_documents(documents)
-                print(f"Successfully added {len(added_ids)} documents.")
+                # content and embedding already have their own columns
+                doc_metadata = {"chunk_sequence": i}
+                # pgvector parses the '[x,y,...]' text form on COPY (for halfvec as well)
+                vector_literal = "[" + ",".join(map(str, embedding)) + "]"
+                rows.append((str(uuid.uuid4()), vector_literal, chunk, json.dumps(doc_metadata)))
+
+            print(f"Number of documents to attempt adding: {len(rows)}")
+
+            if rows:
+                self._copy_rows(rows)
+                print(f"Successfully added {len(rows)} documents.")
             else:
                 print("No documents to add.")
         except Exception as e:
             raise Exception(f"Error storing embeddings: {e}")
 
+# Shared instances reused across process_file calls; created lazily on first use
+_embedding_generator = None
+_pg_store = None
+# reentrant because PGVectorStore() asks for the embedding generator while the lock is held
+_instances_lock = threading.RLock()
+
+
+def get_embedding_generator() -> FileEmbeddingGenerator:
+    global _embedding_generator
+    if _embedding_generator is None:
+        with _instances_lock:
+            if _embedding_generator is None:
+                _embedding_generator = FileEmbeddingGenerator()
+    return _embedding_generator
+
+
+def get_pg_store() -> PGVectorStore:
+    global _pg_store
+    if _pg_store is None:
+        with _instances_lock:
+            if _pg_store is None:
+                _pg_store = PGVectorStore()
+    return _pg_store
+
+
 def _extract_text_from_pdf(file_path: str) -> str:
     """
-    Extract text from a PDF using PyPDF2. Raises a clear error if PyPDF2 is not installed.
+    Extract text from a PDF using pypdfium2 (PDFium bindings), which is much faster than pure-Python parsers.
+    """
+    if pdfium is None:
+        raise RuntimeError("pypdfium2 is required to extract text from PDFs. Install with: pip install pypdfium2")
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        parts = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            parts.append(textpage.get_text_range() or "")
+            textpage.close()
+            page.close()
+        return "\n".join(parts)
+    finally:
+        pdf.close()
+
+
+@functools.lru_cache(maxsize=1)
+def _lazy_import_docx():
+    """
+    Import python-docx on first use so workers that never see a .docx skip its import cost.
     """
-    if PdfReader is None:
-        raise RuntimeError("PyPDF2 is required to extract text from PDFs. Install with: pip install PyPDF2")
-    reader = PdfReader(file_path)
-    parts = []
-    for page in reader.pages:
-        parts.append(page.extract_text() or "")
-    return "\n".join(parts)
+    try:
+        import docx
+    except ImportError:
+        return None
+    return docx
 
 
 def _extract_text_from_docx(file_path: str) -> str:
     """
     Extract text from a .docx using python-docx.
     """
+    docx = _lazy_import_docx()
     if docx is None:
         raise RuntimeError("python-docx is required to extract text from .docx files. Install with: pip install python-docx")
     doc = docx.Document(file_path)
@@ -117,32 +223,56 @@ def _extract_text_from_docx(file_path: str) -> str:
 
 def _extract_text_from_doc(file_path: str) -> str:
     """
-    Extract text from a legacy .doc using textract if available.
+    Extract text from a legacy .doc by running antiword directly.
     """
-    if textract is None:
-        raise RuntimeError("textract is required to extract text from .doc files. Install with: pip install textract")
-    # textract returns bytes
-    text = textract.process(file_path)
     try:
-        return text.decode("utf-8", errors="ignore")
-    except Exception:
-        return str(text)
+        result = subprocess.run(
+            ["antiword", file_path],
+            capture_output=True,
+            check=True,
+            timeout=60,
+        )
+    except FileNotFoundError:
+        raise RuntimeError("antiword is required to extract text from .doc files. Install it with your system package manager (e.g. apt install antiword)")
+    except subprocess.CalledProcessError as e:
+        stderr = (e.stderr or b"").decode("utf-8", errors="ignore").strip()
+        raise RuntimeError(f"antiword failed on {file_path} (exit status {e.returncode}): {stderr}")
+    return result.stdout.decode("utf-8", errors="ignore")
+
+
+def _detect_text_encoding(head: bytes) -> str:
+    """
+    Pick an encoding from the first bytes of a file, preferring UTF-8 when they decode cleanly.
+    charset-normalizer is only trusted for BOMs and multi-byte encodings (UTF-16/32, CJK);
+    its guesses between single-byte code pages are unreliable (cp1252 text often comes back
+    as cp1250), so other files default to cp1252.
+    """
+    try:
+        # incremental decode so a multi-byte character cut at the boundary is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        pass
+    match = charset_normalizer.from_bytes(head).best()
+    if match and (match.bom or is_multi_byte_encoding(match.encoding)):
+        return match.encoding
+    return "cp1252"
 
 
 def _extract_text_from_txt(file_path: str) -> str:
     """
-    Extract text from a .txt file with robust decoding fallback.
+    Extract text from a .txt file, sniffing the encoding from its head and decoding once.
+    Falls back to latin-1 (which never fails) if the file does not decode strictly with the sniffed
+    encoding, e.g. bytes cp1252 leaves undefined or a later part that is not valid UTF-8.
     """
     with open(file_path, "rb") as fh:
+        encoding = _detect_text_encoding(fh.read(TXT_SNIFF_BYTES))
+        fh.seek(0)
         raw = fh.read()
-    # try utf-8, then fallback to latin-1 to avoid decode errors
-    for enc in ("utf-8", "utf-8-sig", "latin-1"):
-        try:
-            return raw.decode(enc)
-        except Exception:
-            continue
-    # final fallback
-    return raw.decode("utf-8", errors="ignore")
+    try:
+        return raw.decode(encoding)
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
 
 
 def _chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[str]:
@@ -151,23 +281,23 @@ def _chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[s
     """
     if chunk_size <= 0:
         raise ValueError("chunk_size must be > 0")
-    chunks: List[str] = []
-    start = 0
+    if overlap < 0:
+        raise ValueError("overlap must be >= 0")
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("overlap must be smaller than chunk_size")
     length = len(text)
-    while start < length:
-        end = min(start + chunk_size, length)
-        chunks.append(text[start:end])
-        # advance start but keep overlap
-        if end == length:
-            break
-        start = max(0, end - overlap)
-    return chunks
+    if length == 0:
+        return []
+    # the last chunk is the first one that reaches the end of the text
+    starts = range(0, max(1, length - overlap), step)
+    return [text[start:start + chunk_size] for start in starts]
 
 
 def process_file(file_path: str, chunk_size: Optional[int] = None, overlap: int = 200) -> dict:
     """
     Main entry to process a file:
-    - Extract text (PDFs via PyPDF2, others via reading)
+    - Extract text (PDFs via pypdfium2, others via reading)
     - Chunk text
     - Generate embeddings with FileEmbeddingGenerator
     - Store vectors using PGVectorStore.store_embeddings
@@ -202,11 +332,9 @@ def process_file(file_path: str, chunk_size: Optional[int] = None, overlap: int
         chunks = _chunk_text(text, chunk_size=int(chunk_size), overlap=int(overlap))
         print(f"[upload_processor] Created {len(chunks)} chunks from {file_path}")
 
-        embedding_gen = FileEmbeddingGenerator()
-        embeddings = embedding_gen.embed_documents(chunks)
+        embeddings = get_embedding_generator().embed_documents(chunks)
 
-        pg_store = PGVectorStore()
-        pg_store.store_embeddings(chunks, embeddings)
+        get_pg_store().store_embeddings(chunks, embeddings)
         return {"status": "processed", "chunks": len(chunks)}
     except Exception as err:
         print(f"[upload_processor] Error processing file {file_path}: {err}")
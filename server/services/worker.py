@@ -0,0 +1,28 @@
+import asyncio
+from arq.worker import func
+from services.task_queue import REDIS_SETTINGS, PROCESSED_KEY_PREFIX
+from services.upload_processor import process_file
+
+# Run the worker from server/ with: arq services.worker.WorkerSettings
+# The API only enqueues jobs (see services.task_queue); nothing is processed without this worker.
+
+
+async def process_file_job(ctx, file_path: str, content_hash: str = None) -> dict:
+    """
+    Worker task wrapping process_file; runs in a thread since process_file is blocking.
+    Records the content hash once processing succeeds so later duplicates are skipped.
+    """
+    result = await asyncio.to_thread(process_file, file_path)
+    if content_hash and result.get("status") == "processed":
+        await ctx["redis"].set(PROCESSED_KEY_PREFIX + content_hash, file_path)
+    return result
+
+
+class WorkerSettings:
+    """arq worker configuration."""
+
+    # keep_result=0: a stored result would block re-queuing the same job id (content hash)
+    # for arq's default hour, including after a failed run
+    functions = [func(process_file_job, name="process_file", keep_result=0)]
+    redis_settings = REDIS_SETTINGS
+    max_jobs = 4
@@ -1,6 +1,11 @@
+import os
 from pydantic import BaseModel, field_validator
 from constant.file_constant import ALLOWED_EXTENSIONS
 
+# Built once at import so the validator does not re-sort and re-join on every rejection
+_ALLOWED = frozenset(ext.lower().lstrip(".") for ext in ALLOWED_EXTENSIONS)
+_ALLOWED_MSG = ", ".join(sorted(_ALLOWED))
+
 
 class FileMeta(BaseModel):
     filename: str
@@ -8,9 +13,8 @@ class FileMeta(BaseModel):
     @field_validator("filename")
     def validate_file_extension(cls, value: str) -> str:
         """Validate file extension and raise user-friendly error."""
-        ext = value.rsplit(".", 1)[-1].lower()
-        if ext not in ALLOWED_EXTENSIONS:
-            allowed = ", ".join(sorted(ALLOWED_EXTENSIONS))
+        ext = os.path.splitext(value)[1][1:].lower()
+        if ext not in _ALLOWED:
             # Raise with a clean message (no debug info needed)
-            raise ValueError(f"Unsupported file type '.{ext}'. Allowed types: {allowed}")
+            raise ValueError(f"Unsupported file type '.{ext}'. Allowed types: {_ALLOWED_MSG}")
         return value